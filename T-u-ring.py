@@ -1,108 +1,518 @@
-from collections import defaultdict
-....
+import itertools
+import locale
+import sys
+
+# Read byte used in the transition table for the wild-card character (*).
+# Real bytes are 0-255, so 256 can never be read from the tape
+WILDCARD = 256
+
+# Byte values that can stand for characters of a machine definition that
+# latin-1 has no byte for (see TuringMachine.read_machine): the upper half
+# of latin-1 first, then the control characters that don't end a line or
+# separate values on it. None of them is a digit, a sign, the blank symbol
+# (-) or the wild card (*), so they can't change how a line is parsed
+SYMBOL_CODES = list(range(128, 256)) + \
+    [code for code in range(32) if code not in b"\t\n\x0b\x0c\r"]
+
+# The most steps TuringMachine.execute lets the inner loop take in one call.
+# The inner loop counts its steps down, and Python keeps a single shared
+# object for each of the integers up to 256, so counting down from at most
+# 256 doesn't create a new integer object on every step
+RUN_STEPS = 256
+
+# The most actions a machine can have for TuringMachine.execute to generate
+# its inner loop (see _compile). Generating and compiling the code takes
+# time for every action, which only pays off once the machine takes many
+# steps, so machines with bigger action tables use the inner loop that looks
+# the actions up in the action table instead (see _interpret)
+COMPILE_LIMIT = 1000
+
+# This function takes many steps of a machine at once. It is used for
+# actions that keep the state and move the head (like "in state 3, while you
+# read 0 or 1, move right", or "in state 5, while you read a, write b and
+# move left"). Such an action is repeated for as long as the head reads one
+# of the bytes in chars (all the bytes for which the state has such an action
+# moving the head in the same direction), so instead of taking these steps
+# one by one, we just look for the first byte that isn't in chars.
+# bytearray's lstrip and rstrip do that search in C. We look at growing
+# chunks of the tape, so a short run doesn't make us copy much of the tape
+# and a long run takes only a few chunks. Then all the bytes the head went
+# over are replaced at once with bytearray's translate.
+#
+# - tape, head, left and right are the same as in the generated inner loop
+#   (see _compile); the head points to a byte in chars
+# - direction is 1 (right) or -1 (left)
+# - table is a translation table (256 bytes) that maps every byte in chars
+#   to the byte its action writes, or None if none of the actions writes
+#   anything (then we don't have to touch the tape at all)
+# - steps is the number of steps we are allowed to take
+# - record is called with a snapshot of the tracked part of the tape after
+#   every step, just like in the inner loop (or it's None if we don't save
+#   the snapshots). It has to be None if table isn't None. The bytes don't
+#   change during the run, so the steps that don't grow the tracked part of
+#   the tape share one snapshot
+# Returns the new (head, left, right, steps), where steps is the number of
+# steps we were still allowed to take. The head points to the first byte
+# (in the direction of the run) that isn't in chars, or outside of the
+# buffer (head < 0 or right > len(tape)) if the run reached its edge - then
+# the snapshot of that last step is left to the caller, like in the inner
+# loop - or to the cell where we ran out of steps
+def _scan(tape, head, left, right, direction, chars, table, steps, record):
+    size = len(tape)
+    start = head
+    chunk = 32
+    if direction > 0:
+        limit = start + steps
+        head += 1
+        while head < size and head < limit:
+            part = tape[head:head + chunk]
+            rest = part.lstrip(chars)
+            head += len(part) - len(rest)
+            if rest:
+                break
+            chunk *= 2
+        head = min(head, limit)
+        if table is not None:
+            tape[start:head] = tape[start:head].translate(table)
+        # The head has visited the cells start + 1 up to end - 1 (the buffer
+        # ends before end if the run reached its edge). Steps inside the
+        # tracked part of the tape all have the same snapshot, then every
+        # step grows it by one cell
+        if record is not None:
+            end = min(head + 1, size)
+            same = min(end, right) - start - 1
+            if same > 0:
+                snapshot = tape[left:right]
+                for _ in range(same):
+                    record(snapshot)
+            for stop in range(max(right, start + 1), end):
+                record(tape[left:stop + 1])
+        right = max(right, head + 1)
+        steps -= head - start
+    else:
+        limit = start - steps
+        head -= 1
+        while head >= 0 and head > limit:
+            part = tape[max(head - chunk + 1, 0):head + 1]
+            rest = part.rstrip(chars)
+            head -= len(part) - len(rest)
+            if rest:
+                break
+            chunk *= 2
+        head = max(head, limit)
+        if table is not None:
+            tape[head + 1:start + 1] = tape[head + 1:start + 1].translate(table)
+        # The same as above, the head has visited the cells start - 1 down
+        # to end + 1
+        if record is not None:
+            end = max(head, 0) - 1
+            same = start - 1 - max(end, left - 1)
+            if same > 0:
+                snapshot = tape[left:right]
+                for _ in range(same):
+                    record(snapshot)
+            for stop in range(min(left, start) - 1, end, -1):
+                record(tape[stop:right])
+        left = min(left, head)
+        steps -= start - head
+    return head, left, right, steps
+
+
+# This function describes the configuration of a machine - everything that
+# decides what the machine is going to do from now on: its state, the
+# contents of the tape and the position of the head. Blank symbols (-) at
+# the ends of the tracked part of the tape are left out (the tape is blank
+# there anyway), and the head position is counted from the first non-blank
+# cell. So two configurations are equal even if one is just the other one
+# moved along the tape - and once a machine gets into the same (or moved)
+# configuration again, it's going to repeat the same steps forever and it
+# never halts
+def _configuration(tape, head, left, right, state):
+    contents = tape[left:right].lstrip(b"-")
+    start = right - len(contents)
+    contents = contents.rstrip(b"-")
+    # On a blank tape, only the state matters
+    return state, head - start if contents else 0, bytes(contents)
+
+
+# This function builds the inner loop of TuringMachine.execute for one
+# particular machine. Instead of looking the actions up in the transition
+# table on every step, it writes Python source code of a function in which
+# the whole action table is spelled out as if/elif branches, with all the
+# numbers (states, bytes to read and write, directions) written directly
+# into the code. Then it compiles that source and returns the function.
+#
+# Inside the generated function, states are numbered 0, 1, 2, ... in the
+# order they appear in the action table (whatever numbers the machine
+# definition uses), so that the branch for the current state can be found
+# by halving the range of numbers: "if state < 4" chooses between states
+# 0-3 and 4-7, then "if state < 2" or "if state < 6" and so on. That takes
+# just a few comparisons even for machines with many states (a chain of
+# "if state == ..." would compare with every state before the right one).
+# For a machine with state 0 that reads 0 (byte 48), writes 1 (byte 49),
+# moves right and goes to state 1, the generated code looks like:
+#
+#     def _run(tape, head, left, right, state, steps, record):
+#         size = len(tape)
+#         ...
+#         while steps:
+#             steps -= 1
+#             c = tape[head]
+#             if state < 1:
+#                 if c == 48:
+#                     state = 1
+#                     tape[head] = 49
+#                     head += 1
+#                     if head >= right:
+#                         ...
+#                 elif ...
+#             else:
+#                 ...
+#             record(tape[left:right])
+#
+# The generated function takes steps of the machine until one of these
+# happens:
+# - the machine reaches the halt state
+# - there is no action for the current state and the byte under the head
+# - the head moves outside of the tape buffer (head < 0 on the left, or
+#   right > len(tape) on the right), so the buffer has to grow
+# - it has taken as many steps as it was allowed to
+# In every case it returns the new (head, left, right, state, steps), where
+# steps is the number of steps it was still allowed to take, and the caller
+# can tell from these values which of the four happened (when the machine
+# gets stuck, steps is never 0).
+#
+# - tape is the tape bytearray, head, left, right and state are the same as
+#   the attributes of TuringMachine with the same names (state is the number
+#   from the machine definition, both when passed in and when returned)
+# - steps is the number of steps the function is allowed to take
+# - record is called with a snapshot of the tracked part of the tape after
+#   every step. The snapshot of a step that moves the head outside of the
+#   buffer is left to the caller, since the caller has to grow the buffer
+#   first
+#
+# If save is False, the generated function doesn't save any snapshots at all
+# (and should be called with record set to None), which makes every step
+# a lot cheaper when the caller doesn't need all of them
+def _compile(transitions, halt_state, save):
+    # Group the actions by state, keeping the order from the machine
+    # definition: {state: {read_byte: (write_byte, direction, new_state)}}
+    # (the packed key is (state << 16) | read_byte, see
+    # TuringMachine.transitions)
+    # The actions of the halt state are never taken, so they are left out
+    states = {}
+    for key, action in transitions.items():
+        if key >> 16 != halt_state:
+            states.setdefault(key >> 16, {})[key & 0xFFFF] = action
+
+    # Number the states: the states with actions first, then the states
+    # that actions lead to but that have no actions themselves ("impossible
+    # states" - the machine gets stuck there). ids maps the numbers back
+    # to the states of the machine definition
+    ids = list(states)
+    for actions in states.values():
+        for write, direction, new_state in actions.values():
+            if new_state not in states and new_state != halt_state \
+                    and new_state not in ids:
+                ids.append(new_state)
+    index = {state: number for number, state in enumerate(ids)}
+
+    code = [
+        "def _run(tape, head, left, right, state, steps, record):",
+        "    size = len(tape)",
+        "    if state == %d:" % halt_state,
+        "        return head, left, right, state, steps",
+        # The machine is stuck right away in a state without actions
+        "    number = index.get(state)",
+        "    if number is None or number >= %d:" % len(states),
+        "        return head, left, right, state, steps",
+    ]
+
+    # The translation tables for _scan (see take_state). They are 256 bytes
+    # long, so instead of writing them into the code, we keep them in a list
+    # and the code refers to them as tables[0], tables[1], ... (a table
+    # used by several actions is kept only once)
+    tables = []
+
+    # An action that keeps the state and moves the head is repeated until
+    # the head reads a byte the action isn't taken for, so we let _scan take
+    # all these steps at once. If we save the tape contents after every
+    # step, this only works for actions that don't change the byte under
+    # the head (otherwise every step has different tape contents)
+    def scanning(state, read, write, direction, new_state):
+        return new_state == state and direction != 0 and \
+            (write in (-1, read) or not save)
+
+    # The code for taking one action, indented to fit inside the branch
+    # for its state and read byte
+    def take_action(indent, state, read, write, direction, new_state, scans):
+        # Changing the state - not needed if the action keeps the state
+        # (the halt state is never stored, we return right after this step)
+        lines = []
+        if new_state != state and new_state != halt_state:
+            lines.append("state = %d" % index[new_state])
+        # Replacing the byte under the head - there's nothing to do if
+        # nothing should be written (-1) or if we would just write the same
+        # byte we have read
+        if write >= 0 and write != read:
+            lines.append("tape[head] = %d" % write)
+        # Moving the head and growing the tracked part of the tape, or
+        # stopping so that the caller grows the buffer (see
+        # TuringMachine.execute)
+        if direction < 0:
+            lines += [
+                "head -= 1",
+                "if head < left:",
+                "    left = head",
+                "    if head < 0:",
+                "        return head, left, right, %d, steps" % new_state,
+            ]
+        elif direction > 0:
+            lines += [
+                "head += 1",
+                "if head >= right:",
+                "    right = head + 1",
+                "    if right > size:",
+                "        return head, left, right, %d, steps" % new_state,
+            ]
+        # Reaching the halt state ends the execution, after saving the tape
+        # contents of this last step. So does reaching a state without
+        # actions - the next step gets stuck, and we leave that to the next
+        # call of the generated function
+        if new_state == halt_state or index.get(new_state, 0) >= len(states):
+            if save:
+                lines.append("record(tape[left:right])")
+            lines.append("return head, left, right, %d, steps" % new_state)
+        # A repeated action is taken once like any other action, then if the
+        # head has come to a byte for which it is repeated, we let _scan take
+        # the rest of the steps (scans holds the bytes to scan over in each
+        # direction and the code for their translation table). Most runs are
+        # short, and checking the next byte is a lot cheaper than calling
+        # _scan
+        if scanning(state, read, write, direction, new_state):
+            chars, table = scans[direction]
+            lines.append("if steps and tape[head] in %r:" % chars)
+            if save:
+                lines.append("    record(tape[left:right])")
+            lines += [
+                "    head, left, right, steps = "
+                "scan(tape, head, left, right, %d, %r, %s, steps, record)"
+                % (direction, chars, table),
+                "    if head < 0 or right > size:",
+                "        break",
+                "    continue",
+            ]
+        # An action that changes nothing at all still needs a statement
+        # (such a machine never halts, just like the definition says)
+        return [indent + line for line in lines or ["pass"]]
+
+    # The code for all the actions of one state. If none of the exact bytes
+    # matches, we take the wild-card (*) action if the state has one,
+    # otherwise we don't know what to do and stop (we haven't taken the step
+    # we counted, so we give it back)
+    def take_state(indent, state, actions):
+        # The wild-card (*) action of this state, looked up once, or None
+        wildcard = actions.get(WILDCARD)
+
+        # Find the bytes for which this state repeats an action moving the
+        # head in each direction, and the bytes these actions write (see
+        # take_action and _scan). We only look at the bytes the state has
+        # actions for, plus all the other bytes if the wild-card action is
+        # one that can be repeated - most states have no such actions at
+        # all, and then there's nothing to look for
+        repeated = [(read, action) for read, action in actions.items()
+                    if read != WILDCARD and scanning(state, read, *action)]
+        if wildcard is not None and wildcard[2] == state and wildcard[1] != 0:
+            repeated += [(read, wildcard)
+                         for read in set(range(256)).difference(actions)
+                         if scanning(state, read, *wildcard)]
+        scans = {}
+        for direction in (1, -1):
+            chars = bytearray()
+            table = bytearray(range(256))
+            for read, action in sorted(repeated):
+                if action[1] == direction:
+                    chars.append(read)
+                    if action[0] >= 0:
+                        table[read] = action[0]
+            if not chars:
+                continue
+            if table == bytearray(range(256)):
+                table = "None"
+            else:
+                if table not in tables:
+                    tables.append(table)
+                table = "tables[%d]" % tables.index(table)
+            scans[direction] = bytes(chars), table
+
+        lines = []
+        for read, (write, direction, new_state) in actions.items():
+            if read == WILDCARD:
+                continue
+            # An action that does exactly what the wild-card action would do
+            # for this byte (writing the byte we have read is the same as not
+            # writing at all) doesn't need a branch of its own - leaving it
+            # out makes the chain of comparisons shorter
+            if wildcard is not None and wildcard[1:] == (direction, new_state) \
+                    and (-1 if write in (-1, read) else write) == \
+                    (-1 if wildcard[0] in (-1, read) else wildcard[0]):
+                continue
+            lines.append(indent + "%s c == %d:" % ("elif" if lines else "if", read))
+            lines += take_action(indent + "    ", state, read,
+                                 write, direction, new_state, scans)
+        if lines:
+            lines.append(indent + "else:")
+            indent += "    "
+        if wildcard is not None:
+            lines += take_action(indent, state, WILDCARD, *wildcard, scans)
+        else:
+            lines.append(indent + "return head, left, right, %d, steps + 1" % state)
+        return lines
+
+    # The code choosing the branch for the current state among the states
+    # numbered from low up to (but not including) high, by halving the range
+    def take_states(indent, low, high):
+        if high - low == 1:
+            return take_state(indent, ids[low], states[ids[low]])
+        middle = (low + high) // 2
+        return [indent + "if state < %d:" % middle] + \
+            take_states(indent + "    ", low, middle) + \
+            [indent + "else:"] + \
+            take_states(indent + "    ", middle, high)
+
+    # (without any actions, the machine is always stuck right away)
+    if states:
+        code += [
+            "    state = number",
+            "    while steps:",
+            "        steps -= 1",
+            "        c = tape[head]",
+        ]
+        code += take_states("        ", 0, len(states))
+        if save:
+            code.append("        record(tape[left:right])")
+        code.append("    return head, left, right, ids[state], steps")
+
+    namespace = {"scan": _scan, "ids": ids, "index": index,
+                 "tables": [bytes(table) for table in tables]}
+    exec(compile("\n".join(code), "<turing machine>", "exec"), namespace)
+    return namespace["_run"]
+
+
+# This function builds the inner loop of TuringMachine.execute for machines
+# with too many actions to generate the code of the loop (see COMPILE_LIMIT).
+# It returns a function that works just like the one _compile returns, but
+# on every step it looks the action up in the transition table, so there's
+# nothing to build ahead of the first step.
+#
+# - transitions and halt_state are the same as the attributes of
+#   TuringMachine with the same names
+def _interpret(transitions, halt_state):
+    get = transitions.get
+
+    def _run(tape, head, left, right, state, steps, record):
+        size = len(tape)
+        while steps and state != halt_state:
+            steps -= 1
+            # Look for the action for the current state and the exact byte
+            # that our head points to. If there isn't one, maybe there's a
+            # wild-card (*) action for the current state. Actions are
+            # non-empty tuples, so a found action is never false and "or"
+            # only falls back to the wild-card lookup when the first lookup
+            # missed
+            key = state << 16
+            action = get(key | tape[head]) or get(key | WILDCARD)
+            # If there isn't one either, we don't know what to do and stop
+            # (we haven't taken the step we counted, so we give it back)
+            if action is None:
+                return head, left, right, state, steps + 1
+
+            # Replace the byte under the head (unless write is -1), move the
+            # head and change the state
+            write, direction, state = action
+            if write >= 0:
+                tape[head] = write
+            head += direction
+
+            # Grow the tracked part of the tape, or stop so that the caller
+            # grows the buffer (see TuringMachine.execute)
+            if head < left:
+                left = head
+                if head < 0:
+                    break
+            elif head >= right:
+                right = head + 1
+                if right > size:
+                    break
+
+            if record is not None:
+                record(tape[left:right])
+        return head, left, right, state, steps
+
+    return _run
+
+
 # TuringMachine class represents our Turing machine;;;;;;;
 
 
 class TuringMachine:
 
-    # Action class represents the action that can be taken in any step of
-    # the execution of Turing machine
-    class Action:
-
-        # Action consists of:
-        #
-        # - self.turing_machine is a reference to the Turing machine this action
-        #   takes place on. Action can change the state of the machine,
-        #   so it needs to be aware of the machine.
-        #
-        # - self.write is a character with which the character at the position
-        #   to which head points to should be replaced (character to write as a
-        #   result of this action)
-        #
-        # - self.direction is an integer (1, 0 or -1) that indicates
-        #   the direction in which we should move the head after replacing
-        #   the character that the head points to
-        #
-        # - self.new_state is an integer indicating the number of the state
-        #   to which machine should transition to as a result of this action
-        def __init__(self, turing_machine, write, direction, new_state):
-            self.turing_machine = turing_machine
-            self.write = write
-            self.direction = direction
-            //self.new_state = new_state
-
-        # This method implements the procedure that takes place when the action
-        # is taken. As the definition of Turing machine describes, action
-        # consists of 3 steps:
-        # - Replace the character that the head points to
-        # - Move the head in the appropriate direction (or don't move it at all)
-        # - Change the current state of the Turing machine to a new appropriate
-        #   state
-        def take_action(self):
-            # Replacing the character with self.write character
-            # *** HAPPENS ONLY IF self.write ISN'T * (* means DON'T WRITE) ***
-            if self.write != "*":
-                self.turing_machine.tape_contents[self.turing_machine.head] = self.write
-
-            # Moving the head - self.direction 1 will move it right, -1 left and
-            # 0 will keep it at the same position
-            self.turing_machine.head += self.direction
-
-            # Moving the head can result in head becoming -1 (if head was
-            # pointing to the first character of tape contents list
-            # (head was 0) and was moved to the left.
-            # If this is the case, we want to expand the content of the tape
-            # that we are keeping track of. Since the tape is infinite
-            # and blank symbols (-) are written all over the place we're not
-            # keeping track of yet, once we start to keep track of this spot,
-            # initially it's going to be filled with -. So our new content
-            # consists of -<old_content>, which means we just have to append -
-            # to the beginning of our tape_content list, and now we consider
-            # head 0 again (since it points to the first element of our
-            # content list
-            if self.turing_machine.head < 0:
-                self.turing_machine.tape_contents = ["-"] + self.turing_machine.tape_contents
-                self.turing_machine.head = 0
-            # Moving the head right can result in head pointing to the position
-            # that is to the right of the last character we are keeping track of
-            # We need to include this character in the tape content we are
-            # keeping track of as well, so we need to append it to our
-            # tape_contents list. Since we haven't kept track of it previously,
-            # it's filled with blank symbol ("-") so this is what we append
-            elif self.turing_machine.head >= len(self.turing_machine.tape_contents):
-                self.turing_machine.tape_contents.append("-")
-
-            # Lastly, we change the state of the Turing machine to the new
-            # state specified by this action
-            self.turing_machine.state = self.new_state
+    # The attributes of a machine (see the constructor below). Listing them
+    # here means every machine keeps them in fixed slots instead of a
+    # dictionary of its own, which takes less memory per machine and makes
+    # reading and writing them a bit faster
+    __slots__ = ("tape", "head", "left", "right", "state", "halt_state",
+                 "transitions", "symbols", "looping", "_compiled")
 
     # Constructor of TuringMachine class.
     # What we need to keep track of in a machine:
-    # - self.head - the position to which the head points to
+    # - self.head - the position to which the head points to. It is an
+    #   absolute index into self.tape, not into the tracked part of the tape
     # - self.state - the current state of the machine
     # - self.halt_state - the halt state - state of the machine which indicates
     #   that the execution of the machine should stop (end state)
-    # - tape_contents - a list of characters representing the part of (infinite)
-    #   machine tape that we keep track of. The rest of the tape (that we aren't
+    # - self.tape - a bytearray holding the part of (infinite) machine tape
+    #   that we keep track of, surrounded by some blank symbols (-) on both
+    #   sides, so that the head can move around without us having to grow
+    #   the bytearray on every step. The rest of the tape (that we aren't
     #   keeping track of) consists of blank symbols (-)
-    # - self.action_table - The action table of this state machine.
-    #   It is a dictionary (hash table) with possible machine states as keys
-    #   and for every state we keep another dictionary (so this is dictionary
-    #   of dictionaries). The second dictionary keeps track of actions that
-    #   should be taken for each possible read character, so it has read
-    #   characters as keys and corresponding actions as values
-    #
-    #   defaultdict is used because it automatically adds a (key, value)
-    #   pair when we access the key for the first time, so we don't have to
-    #   care about creating an empty dictionary before adding the first element
-    #   for each machine state. Otherwise, usage of defaultdict is the same
-    #   as of dict.
+    # - self.left and self.right - the bounds of the part of self.tape that
+    #   we keep track of (self.tape[self.left:self.right]). It is the part of
+    #   the tape given in the machine definition plus every cell the head
+    #   has visited so far
+    # - self.symbols - the characters of the machine definition that latin-1
+    #   has no byte for, keyed by the byte value we use for each of them on
+    #   the tape and in the action table (see read_machine), or None if
+    #   there are no such characters
+    # - self.looping - True if the last call of execute stopped because the
+    #   machine got into a loop (it never halts), False otherwise (it halted,
+    #   got stuck or took max_steps steps)
+    # - self._compiled - the inner loops of execute generated for this
+    #   machine by _compile so far, keyed by the save argument of _compile
+    # - self.transitions - The action table of this state machine.
+    #   It is a single dictionary (hash table) that maps a (state, read byte)
+    #   pair to the action that should be taken. The pair is packed into one
+    #   integer, (state << 16) | read_byte, so finding the action takes just
+    #   one hash of an integer. Wild-card (*) reads use WILDCARD as read byte.
+    #   Each action is a tuple (write_byte, direction, new_state):
+    #   * write_byte is the byte value (integer 0-255) with which the byte
+    #     at the position to which head points to should be replaced, or -1
+    #     if nothing should be written (* in the machine definition)
+    #   * direction is an integer (1, 0 or -1) that indicates the direction
+    #     in which we should move the head after replacing the byte
+    #   * new_state is an integer indicating the number of the state to
+    #     which machine should transition to as a result of this action
     def __init__(self):
-        self.head = 0
+        self.tape = bytearray(b"-" * 64)
+        self.left = 32
+        self.right = 32
+        self.head = 32
         self.state = 0
         self.halt_state = 0
-        self.tape_contents = []
-        self.action_table = defaultdict(dict)
+        self.transitions = {}
+        self.symbols = None
+        self.looping = False
+        self._compiled = {}
 
     # This method parses the machine definition from the file with name filename
     # Returns a success flag:
@@ -110,9 +520,13 @@ class TuringMachine:
     # - False if there's been an error in any step of parsing (meaning file
     #   isn't correctly formatted)
     def read_machine(self, filename):
-        # We read the whole file content into a list of lines
-        with open(filename, "r") as f:
-            lines = f.read().splitlines()
+        # A new action table needs new inner loops
+        self._compiled = {}
+
+        # We read the whole file content as bytes, since that's what we keep
+        # the tape and the bytes of the actions as anyway
+        with open(filename, "rb") as f:
+            data = f.read()
 
         # Correct input file has at least first 4 lines:
         # <Starting contents of tape>
@@ -120,59 +534,100 @@ class TuringMachine:
         # <Start state index (integer)>
         # <Halting state index (integer)>
         # If this isn't a case, stop parsing and return error flag
-        if len(lines) < 4:
-            return False
-
         try:
-            # First line is <Starting contents of tape>
-            self.tape_contents = list(lines[0])
+            # A machine definition is usually plain ASCII, and then every
+            # character is already exactly one byte. Otherwise we decode the
+            # file the same way open() would for a text file (bytes that
+            # can't be decoded raise UnicodeDecodeError, which is a
+            # ValueError) and encode it with latin-1, which maps the first
+            # 256 characters to exactly one byte. Every other character
+            # (like a symbol such as \u2605) gets a byte value of its own that
+            # no character of the file uses (see SYMBOL_CODES), and symbols
+            # remembers which character to put back for it when we turn the
+            # tape contents into strings. If there aren't enough free byte
+            # values for all of them, it's an error
+            symbols = None
+            if not data.isascii():
+                text = data.decode(locale.getpreferredencoding(False))
+                others = sorted(set(char for char in text if ord(char) > 255))
+                if others:
+                    used = set(ord(char) for char in text if ord(char) <= 255)
+                    free = [code for code in SYMBOL_CODES if code not in used]
+                    if len(others) > len(free):
+                        return False
+                    symbols = dict(zip(free, others))
+                    text = text.translate(
+                        {ord(char): code for code, char in symbols.items()})
+                data = text.encode("latin-1")
+            lines = data.splitlines()
+            if len(lines) < 4:
+                return False
+
+            # First line is <Starting contents of tape>. Tape is kept as bytes
+            contents = lines[0]
             # Second line is <Starting offset of machine head>
-            self.head = int(lines[1])
+            offset = int(lines[1])
+
+            # We put the starting contents in the middle of our tape buffer,
+            # with enough blanks on both sides so that the head (even if
+            # it starts outside of the given contents) points inside the buffer
+            pad = max(32, len(contents), abs(offset) + 1)
+            self.tape = bytearray(b"-" * pad + contents + b"-" * pad)
+            self.head = pad + offset
+            # If the head starts outside of the given contents, the cell it
+            # points to is also a part of the tape we keep track of
+            self.left = min(pad, self.head)
+            self.right = max(pad + len(contents), self.head + 1)
             # Third line is <Start state index (integer)>
             self.state = int(lines[2])
             # Fourth line is <Halting state index (integer)>
             self.halt_state = int(lines[3])
 
             # All the other lines, beginning from fifth line (index 4)
-            # are <Action table>
-            for i in range(4, len(lines)):
+            # are <Action table> (empty lines are skipped)
+            # We fill a local dictionary first (reading a local variable is
+            # cheaper than reading self.transitions for every line)
+            transitions = {}
+            for line in itertools.islice(lines, 4, None):
+                if not line:
+                    continue
+
                 # Each Action line is in this form:
                 # <State index> <Read> <Write> <Direction> <New state index>
-                # Let's make a list (called line) with these 5 values
-                # (we have to split our line using the space as a delimiter)
-                # So now,
-                # <State index> is in line[0]
-                # <Read> is in line[1]
-                # <Write> is in line[2]
-                # <Direction> is in line[3]
-                # <New state index> is in line[4]
-                # but they are all strings, so when we need integers
+                # We split the line on whitespace, at most 5 times, and take
+                # the first 5 values. Anything after them (like a comment at
+                # the end of the line) is ignored. If there are fewer than 5
+                # values, unpacking them throws ValueError
+                # The values are all bytes, so when we need integers
                 # (like for Direction or State index), we need to convert them
-                # to int with e.g. int(line[3]). If there's an error in file,
+                # to int with e.g. int(direction). If there's an error in file,
                 # and these strings cannot be converted to int, conversion
-                # methods throw ValueError exceptions (thus this is all done
-                # in try block)
+                # methods throw ValueError exceptions as well (thus this is
+                # all done in try block)
+                state, read, write, direction, new_state = line.split(None, 5)[:5]
 
-                line = lines[i].split(' ')
+                # We convert <Direction> to an integer, once, and check it
+                # together with <Read> and <Write>
+                direction = int(direction)
 
-                # If we didn't get all of our 5 needed values, return error flag
-                if len(line) < 5:
-                    return False
-
-                # If we didn't get a SINGLE character for <Read> OR
-                # if we didn't get a SINGLE character for <Write> OR
+                # If we didn't get EXACTLY ONE character for <Read> OR
+                # if we didn't get EXACTLY ONE character for <Write> OR
                 # if we got a direction that's not -1, 0 or 1
                 # it's an error, so just stop parsing and return error flag
-                if len(line[1]) > 1 or len(line[2]) > 1 or abs(int(line[3])) > 1:
+                if len(read) != 1 or len(write) != 1 or direction not in (-1, 0, 1):
                     return False
 
                 # If all is right, add an entry to our action table
-                # In our action_table, using the key <State> (line[0])
-                # to access the dictionary of Actions, and using the key
-                # <Read> for that dictionary, add a new Action given <Write>
-                # character, <Direction> integer and <New state index> integer
-                self.action_table[int(line[0])][line[1]] =\
-                    TuringMachine.Action(self, line[2], int(line[3]), int(line[4]))
+                # The key packs <State> and the byte value of <Read> (or
+                # WILDCARD for *) into one integer. The value is a tuple of the
+                # byte value of <Write> (-1 for *), <Direction> integer and
+                # <New state index> integer
+                transitions[(int(state) << 16) |
+                            (WILDCARD if read == b"*" else read[0])] =\
+                    (-1 if write == b"*" else write[0], direction, int(new_state))
+
+            self.transitions = transitions
+            self.symbols = symbols
         except ValueError:
             # If there was any conversion error, return error flag
             return False
@@ -186,48 +641,178 @@ class TuringMachine:
     #
     # This method returns a list of strings, where each string
     # represents characters on tape that we are currently keeping track of
-    # (which are in self.tape_contents list), so it returns a list
+    # (which are in self.tape[self.left:self.right]), so it returns a list
     # of tape contents in each step of execution until the halt state is reached
     # If an error is detected during execution, the method returns None instead
-    def execute(self):
-        # Add the starting tape contents to the resulting list of tape contents
-        all_tape_contents = ["".join(self.tape_contents)]
-
-        # Execute the machine - while the state doesn't become halt state
-        while self.state != self.halt_state:
-            # If the current state is not in our action table (we reached
-            # an "impossible state" for some reason, stop the execution and
-            # return None
-            if self.state not in self.action_table:
-                return None
-            # If the exact character that our head points to is in our action
-            # table for the current state, keep it in a read variable
-            if self.tape_contents[self.head] in self.action_table[self.state]:
-                read = self.tape_contents[self.head]
-            # If there isn't the exact read character, maybe there's a wild-card
-            # character (*). If so, keep it in read for later
-            elif "*" in self.action_table[self.state]:
-                read = "*"
-            # If there isn't an action for the character we read from head
-            # position, we don't know what to do at this point, so just
-            # stop the execution and return None
+    #
+    # Saving the tape contents in every step takes much more time and memory
+    # than the steps themselves, so the caller can ask for less:
+    # - if record is False, the list holds only the tape contents at the
+    #   point we reached halt state
+    # - otherwise, the list holds the tape contents at the start and after
+    #   every every-th step, plus the tape contents at the point we reached
+    #   halt state
+    # every has to be at least 1, otherwise the method raises ValueError
+    #
+    # If detect_loops is True, we also watch out for the machine getting
+    # into the same configuration (see _configuration) again, which means
+    # it never halts. If that happens, we stop the execution and the method
+    # returns False. Not every loop is noticed right away: we compare the
+    # configuration between runs of the inner loop with a single saved one,
+    # which we replace after 1, 2, 4, 8, ... runs, so the loop is noticed
+    # once the time between these replacements gets longer than the loop
+    #
+    # If max_steps is given, we stop the execution after that many steps if
+    # the machine hasn't halted yet, and the method returns False as well.
+    # max_steps can't be negative, otherwise the method raises ValueError.
+    # self.looping tells the two cases apart (it's True only if the machine
+    # got into a loop). In both cases the machine is left in the
+    # configuration where we stopped, so calling execute again continues
+    # from there
+    def execute(self, record=True, every=1, detect_loops=False, max_steps=None):
+        tape = self.tape
+        head = self.head
+        left = self.left
+        right = self.right
+        state = self.state
+        halt_state = self.halt_state
+
+        # We can't save the tape contents after every 0th (or -1st) step.
+        # The inner loop would be allowed to take no steps at all, and we
+        # would keep saving the same tape contents forever
+        if every < 1:
+            raise ValueError("every must be at least 1, not %r" % (every,))
+        # The inner loop can't take a negative number of steps either
+        if max_steps is not None and max_steps < 0:
+            raise ValueError("max_steps can't be negative, not %r" % (max_steps,))
+
+        # Saving every single step is done inside the inner loop, otherwise
+        # we let the inner loop run every steps at a time and save the tape
+        # contents after each of these runs. If we don't save anything in
+        # between, every is just larger than any number of steps we could
+        # ever take
+        save = record and every == 1
+        if not record or save:
+            every = sys.maxsize
+
+        # Generate the inner loop for this machine the first time we need it,
+        # or look the actions up in the action table if there are too many
+        # of them (see COMPILE_LIMIT)
+        if save not in self._compiled:
+            if len(self.transitions) > COMPILE_LIMIT:
+                self._compiled[save] = _interpret(self.transitions, halt_state)
             else:
-                return None
-
-            # If everything was OK, variable read keeps track of the place
-            # in dictionary where we should look for our action
-            # Access the action and take it!
-            self.action_table[self.state][read].take_action()
-
-            # Finally, since the action put us in a new state and (most likely)
-            # changed the tape content, we have to save it in our list
-            # of contents in all steps.
-            # Since we're keeping track of tape contents in a list of characters
-            # we want to convert it to string first. join method does that, and
-            # "".join(...) tells join not to add any character in between (thus
-            # empty string "")
-            all_tape_contents.append("".join(self.tape_contents))
+                self._compiled[save] = _compile(self.transitions, halt_state, save)
+        run = self._compiled[save]
 
-        return all_tape_contents
+        # Add the starting tape contents to the resulting list of tape contents
+        # Snapshots are kept as raw bytes while the machine runs and are all
+        # turned into strings once at the end. They only hold the tracked
+        # part of the tape (self.tape[self.left:self.right]), never the
+        # blanks allocated around it, so growing the buffer doesn't make
+        # them any longer
+        snapshots = [tape[left:right]] if record else []
+        save = snapshots.append if save else None
+
+        # Execute the machine - run takes the steps until the machine halts,
+        # gets stuck, needs more tape or takes all the steps we allowed
+        # (never more than RUN_STEPS, and never more than the number of steps
+        # until we have to save the tape contents again or until we have to
+        # stop). In the last two cases we grow the tape or save the tape
+        # contents if needed and let run continue
+        until_save = every
+        until_stop = sys.maxsize if max_steps is None else max_steps
+        runs = 0
+        saved_at = 1
+        saved = None
+        unfinished = looping = False
+        while True:
+            allowed = min(until_save, until_stop, RUN_STEPS)
+            head, left, right, state, steps = run(
+                tape, head, left, right, state, allowed, save)
+            until_save -= allowed - steps
+            until_stop -= allowed - steps
+
+            # The head moved outside of the allocated blanks, so we have to
+            # grow the buffer
+            if head < 0 or right > len(tape):
+                # The head moved left of the allocated blanks (head is -1).
+                # We grow the buffer by its whole current size, so that the
+                # number of times we have to copy the buffer stays small
+                # (doubling) no matter how far the machine goes to the left
+                if head < 0:
+                    pad = len(tape)
+                    tape[0:0] = b"-" * pad
+                    head += pad
+                    left += pad
+                    right += pad
+                # The head moved right of the allocated blanks, so we double
+                # the buffer by appending blanks to its end
+                else:
+                    tape.extend(b"-" * len(tape))
+
+                # Save the tape contents of the step that needed more tape
+                if save is not None:
+                    save(tape[left:right])
+            # Otherwise, if run didn't just take all the steps we allowed,
+            # the machine either halted, or there was no action for the byte
+            # under the head and we stop
+            elif steps or state == halt_state:
+                break
+
+            # Save the tape contents after every every-th step
+            if not until_save:
+                snapshots.append(tape[left:right])
+                until_save = every
 
+            # We took max_steps steps and the machine hasn't halted yet
+            if not until_stop and state != halt_state:
+                unfinished = True
+                break
 
+            # Compare the configuration with the saved one (only if the state
+            # is the same, which is cheap to check), and replace the saved
+            # one after 1, 2, 4, 8, ... runs
+            if detect_loops:
+                runs += 1
+                if saved is not None and saved[0] == state and \
+                        _configuration(tape, head, left, right, state) == saved:
+                    unfinished = looping = True
+                    break
+                if runs == saved_at:
+                    saved = _configuration(tape, head, left, right, state)
+                    saved_at *= 2
+
+        self.head, self.left, self.right, self.state = head, left, right, state
+        self.looping = looping
+
+        # If the machine got into a loop, it's never going to halt, or we
+        # gave up waiting for it to halt
+        if unfinished:
+            return False
+
+        # If we stopped before reaching the halt state, we didn't know what to
+        # do at some point, so return None
+        if state != halt_state:
+            return None
+
+        # Save the tape contents at the point we reached halt state, unless
+        # we already did
+        if save is None and until_save != every or not record:
+            snapshots.append(tape[left:right])
+
+        # Turn all the snapshots into strings in one pass. Steps of a run
+        # taken by _scan share one snapshot, so they share one string as well.
+        # Byte values that stand for characters latin-1 has no byte for are
+        # turned back into those characters
+        symbols = self.symbols
+        all_tape_contents = []
+        last = None
+        for snapshot in snapshots:
+            if snapshot is not last:
+                contents = snapshot.decode("latin-1")
+                if symbols is not None:
+                    contents = contents.translate(symbols)
+                last = snapshot
+            all_tape_contents.append(contents)
+        return all_tape_contents
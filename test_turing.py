@@ -0,0 +1,253 @@
+import importlib.util
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+# T-u-ring.py can't be imported by its name, so we load it from its path
+_spec = importlib.util.spec_from_file_location(
+    "turing", os.path.join(os.path.dirname(os.path.abspath(__file__)), "T-u-ring.py"))
+turing = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(turing)
+
+
+# This function is a reference Turing machine: it takes the steps one by one,
+# in the simplest possible way, with the tape kept as a list of characters
+# (strings). TuringMachine.execute is checked against it.
+#
+# It returns (all tape contents, steps), where all tape contents is the list
+# TuringMachine.execute would return (or None if the machine gets stuck, or
+# False if it doesn't halt within max_steps steps), and steps is the number
+# of steps it has taken. If configurations is a list, the configuration
+# (see turing._configuration) at the start and after every step is
+# appended to it
+def reference(text, max_steps, configurations=None):
+    lines = text.splitlines()
+    tape = list(lines[0])
+    head = int(lines[1])
+    state = int(lines[2])
+    halt_state = int(lines[3])
+    actions = {}
+    for line in lines[4:]:
+        values = line.split()
+        actions[int(values[0]), values[1]] = \
+            values[2], int(values[3]), int(values[4])
+
+    # If the head starts outside of the given contents, the cell it points
+    # to is also a part of the tape
+    if head < 0:
+        tape = ["-"] * -head + tape
+        head = 0
+    tape += ["-"] * (head + 1 - len(tape))
+
+    all_tape_contents = ["".join(tape)]
+    if configurations is not None:
+        configurations.append(configuration(tape, head, state))
+    while state != halt_state:
+        if len(all_tape_contents) > max_steps:
+            return False, max_steps
+        action = actions.get((state, tape[head])) or actions.get((state, "*"))
+        if action is None:
+            return None, len(all_tape_contents) - 1
+        write, direction, state = action
+        if write != "*":
+            tape[head] = write
+        head += direction
+        if head < 0:
+            tape.insert(0, "-")
+            head = 0
+        elif head == len(tape):
+            tape.append("-")
+        all_tape_contents.append("".join(tape))
+        if configurations is not None:
+            configurations.append(configuration(tape, head, state))
+    return all_tape_contents, len(all_tape_contents) - 1
+
+
+# The configuration of the reference machine, the same as the one of
+# turing._configuration (blanks at the ends left out, head counted from the
+# first non-blank cell)
+def configuration(tape, head, state):
+    contents = "".join(tape)
+    start = len(contents) - len(contents.lstrip("-"))
+    contents = contents.strip("-")
+    return state, head - start if contents else 0, contents
+
+
+# This function writes the definition of a random machine. The machines are
+# small, but some of them get long runs of the same symbol on the tape, so
+# that the actions repeated over many cells (see turing._scan) are tried too
+def random_machine(rng):
+    symbols = rng.choice(["01-", "ab-", "01x-", "□■-"])
+    states = rng.randint(1, 6)
+    if rng.random() < 0.7:
+        contents = "".join(rng.choice(symbols) for _ in range(rng.randint(1, 12)))
+    else:
+        contents = rng.choice(symbols) * rng.randint(30, 300)
+    actions = []
+    for state in range(states):
+        reads = rng.sample(symbols + "*", rng.randint(1, len(symbols) + 1))
+        for read in reads:
+            actions.append("%d %s %s %d %d" % (
+                state, read, rng.choice(symbols + "*"), rng.choice([-1, 0, 1, 1, -1]),
+                rng.randrange(states + 1) if rng.random() < 0.5 else state))
+    rng.shuffle(actions)
+    lines = [contents, str(rng.randint(-3, len(contents) + 2)), "0", str(states)]
+    return "\n".join(lines + actions) + "\n"
+
+
+class TestExecute(unittest.TestCase):
+
+    # The number of random machines each test tries, and the most steps we
+    # let a machine take before we give up waiting for it to halt
+    MACHINES = 300
+    MAX_STEPS = 1000
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    # Read a machine definition into a new TuringMachine. If tight is True,
+    # the tape buffer holds just the tracked part of the tape, so that the
+    # head leaves it right away and the buffer has to grow on both sides
+    def machine(self, text, tight=False):
+        filename = os.path.join(self.directory.name, "machine.txt")
+        with open(filename, "w") as f:
+            f.write(text)
+        machine = turing.TuringMachine()
+        self.assertTrue(machine.read_machine(filename), text)
+        if tight:
+            machine.tape = machine.tape[machine.left:machine.right]
+            machine.head -= machine.left
+            machine.right -= machine.left
+            machine.left = 0
+        return machine
+
+    # Random machine definitions with their reference results
+    def machines(self, seed):
+        rng = random.Random(seed)
+        for _ in range(self.MACHINES):
+            text = random_machine(rng)
+            yield rng, text, reference(text, self.MAX_STEPS)
+
+    # Both inner loops are tried: the generated one, and the one that looks
+    # the actions up in the action table (used for machines with more than
+    # COMPILE_LIMIT actions)
+    def test_every_step(self):
+        for rng, text, (expected, _) in self.machines(1):
+            if expected is not False:
+                for limit in (turing.COMPILE_LIMIT, 0):
+                    with mock.patch.object(turing, "COMPILE_LIMIT", limit):
+                        for tight in (False, True):
+                            self.assertEqual(self.machine(text, tight).execute(),
+                                             expected, text)
+
+    # A machine with thousands of states, each of them taken once
+    def test_many_states(self):
+        states = 5000
+        lines = ["0101", "0", "0", str(states)]
+        for state in range(states):
+            lines += ["%d 0 1 1 %d" % (state, state + 1),
+                      "%d 1 0 1 %d" % (state, state + 1),
+                      "%d - %d -1 %d" % (state, state % 2, state + 1)]
+        text = "\n".join(lines) + "\n"
+        expected, _ = reference(text, states)
+        machine = self.machine(text)
+        self.assertGreater(len(machine.transitions), turing.COMPILE_LIMIT)
+        self.assertEqual(machine.execute(record=False), expected[-1:])
+        self.assertEqual(self.machine(text).execute(), expected)
+
+    def test_final_step(self):
+        for rng, text, (expected, _) in self.machines(2):
+            if expected is not False:
+                result = self.machine(text, rng.random() < 0.5).execute(record=False)
+                self.assertEqual(result, expected and expected[-1:], text)
+
+    def test_every_kth_step(self):
+        for rng, text, (expected, _) in self.machines(3):
+            if expected is not False:
+                every = rng.randint(2, 9)
+                if expected:
+                    steps = len(expected) - 1
+                    expected = expected[::every] + \
+                        (expected[-1:] if steps % every else [])
+                result = self.machine(text, rng.random() < 0.5).execute(every=every)
+                self.assertEqual(result, expected, text)
+
+    def test_max_steps(self):
+        for rng, text, (expected, steps) in self.machines(4):
+            machine = self.machine(text, rng.random() < 0.5)
+            max_steps = rng.randint(0, 40)
+            result = machine.execute(record=False, max_steps=max_steps)
+            # A machine that gets stuck after exactly max_steps steps hasn't
+            # tried the next step yet
+            if expected is False or steps > max_steps or \
+                    expected is None and steps == max_steps:
+                self.assertIs(result, False, text)
+                self.assertFalse(machine.looping)
+                # The machine continues from where it stopped
+                if expected is not False:
+                    self.assertEqual(machine.execute(record=False),
+                                     expected and expected[-1:], text)
+            else:
+                self.assertEqual(result, expected and expected[-1:], text)
+
+    def test_detect_loops(self):
+        for rng, text, (expected, _) in self.machines(5):
+            machine = self.machine(text, rng.random() < 0.5)
+            result = machine.execute(record=False, detect_loops=True,
+                                     max_steps=self.MAX_STEPS)
+            if expected is not False:
+                self.assertEqual(result, expected and expected[-1:], text)
+            elif machine.looping:
+                # The machine really got into a configuration it has been in
+                # before
+                self.assertIs(result, False, text)
+                configurations = []
+                reference(text, self.MAX_STEPS, configurations)
+                self.assertLess(len(set(configurations)), len(configurations), text)
+            else:
+                self.assertIs(result, False, text)
+
+    def test_loop_is_detected(self):
+        # The head moves between two cells forever
+        machine = self.machine("01\n0\n0\n9\n0 0 0 1 1\n1 1 1 -1 0\n")
+        self.assertIs(machine.execute(detect_loops=True, max_steps=1000), False)
+        self.assertTrue(machine.looping)
+
+    def test_invalid_arguments(self):
+        machine = self.machine("0\n0\n0\n1\n0 0 1 1 1\n")
+        with self.assertRaises(ValueError):
+            machine.execute(every=0)
+        with self.assertRaises(ValueError):
+            machine.execute(max_steps=-1)
+
+
+class TestReadMachine(unittest.TestCase):
+
+    def read(self, text):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "machine.txt")
+            with open(filename, "w") as f:
+                f.write(text)
+            machine = turing.TuringMachine()
+            return machine.read_machine(filename) and machine.execute()
+
+    def test_symbols(self):
+        self.assertEqual(
+            self.read("□■\n0\n0\n1\n0 □ ★ 1 0\n0 ■ \xe9 0 1\n"),
+            ["□■", "★■", "★\xe9"])
+
+    def test_extra_fields(self):
+        self.assertEqual(self.read("0\n0\n0\n1\n0 0 1 0 1  # note\n"), ["0", "1"])
+
+    def test_invalid_lines(self):
+        self.assertFalse(self.read("0\n0\n0\n"))
+        self.assertFalse(self.read("0\n0\n0\n1\n0 0 1 0\n"))
+        self.assertFalse(self.read("0\n0\n0\n1\n0 00 1 0 1\n"))
+        self.assertFalse(self.read("0\n0\n0\n1\n0 0 1 2 1\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()